@@ -11,7 +11,12 @@ See README.md for details.
 #
 
 import csv
+import functools
+import itertools
+import multiprocessing
+import re
 import string
+import sys
 import time
 
 import unidecode
@@ -24,6 +29,9 @@ import unidecode
 INPUT_FILENAME = r"./source_names.csv"
 OUTPUT_FILENAME = r"./clean_names.csv"
 
+# Number of worker processes used to clean rows; None uses every available CPU.
+PROCESSES = None
+
 #
 # FIXED CONSTANTS
 #
@@ -54,6 +62,31 @@ OUTPUT_FIELDS = [
     "given_final_word",
 ]
 
+# Rows are handed to the worker processes in batches of this many rows.
+BATCH_SIZE = 10000
+
+# Progress is reported at most once per this many seconds.
+PROGRESS_INTERVAL = 5
+
+# Source and cleaned files are read and written through buffers of this many bytes.
+IO_BUFFER_SIZE = 1 << 20
+
+# After unidecode, names are plain ascii, so they can be cleaned as bytes: a table to
+# lowercase the letters, and the bytes to delete that are not letters (or spaces).
+_LOWERCASE = bytes.maketrans(
+    string.ascii_uppercase.encode("ascii"), string.ascii_lowercase.encode("ascii")
+)
+_NOT_LETTERS = bytes(c for c in range(256) if chr(c) not in string.ascii_letters)
+_NOT_LETTERS_SPACE = bytes(
+    c for c in range(256) if chr(c) not in string.ascii_letters + " "
+)
+
+# Cleaned output fields only ever hold ascii letters and digits, so the output CSV
+# is written directly; only passthrough fields (e.g. IDs) may need csv-style quoting.
+_NEEDS_QUOTING = re.compile(r'[,"\r\n]')
+# Same as csv.writer's default
+_LINE_TERMINATOR = "\r\n"
+
 #
 # MAIN
 #
@@ -63,14 +96,94 @@ def main():
     """Primary execution to run when this file is directly executed"""
 
     nicknames = load_nicknames(NICKNAME_FILENAME)
-    input_table = load_input(INPUT_FILENAME)
 
-    # Raise an exception unless input field is present in the input table.
-    assert set(INPUT_FIELDS) <= set(input_table[0]), "Not all input fields were found."
+    print("Reading source names from {}.".format(INPUT_FILENAME))
+    # utf-8-sig should provide a little more flexibility, e.g., SSMS outputs a BOM
+    with open(
+        INPUT_FILENAME, "r", encoding="utf-8-sig", buffering=IO_BUFFER_SIZE
+    ) as infile, open(OUTPUT_FILENAME, "wb", buffering=IO_BUFFER_SIZE) as outfile:
+        reader = csv.reader(infile)
+        header = next(reader, [])
+        # Raise an exception unless input field is present in the input file.
+        assert not set(INPUT_FIELDS) - set(header), "Not all input fields found."
+
+        # Rows are plain lists, so fields are picked out by their column position:
+        # the INPUT_FIELDS to be cleaned, and anything else (e.g. IDs) passed as-is.
+        input_index = [header.index(field) for field in INPUT_FIELDS]
+        passthrough_index = [
+            j
+            for j, field in enumerate(header)
+            if field not in INPUT_FIELDS + OUTPUT_FIELDS
+        ]
+        output_header = OUTPUT_FIELDS + [
+            quote_field(header[j]) for j in passthrough_index
+        ]
+        outfile.write(format_lines([output_header]))
+
+        # Rows are cleaned in worker processes, each given its own copy of the lookup
+        # and column positions once up front rather than with every batch.
+        initargs = (nicknames, len(header), input_index, passthrough_index)
+        # Like csv.DictReader, skip over blank lines.
+        batches = batched(filter(None, reader), BATCH_SIZE)
+        row_count = 0
+        last_report = time.monotonic()
+        with multiprocessing.Pool(PROCESSES, init_worker, initargs) as pool:
+            # imap (unlike imap_unordered) returns batches in their original order.
+            for batch_count, output_lines in pool.imap(clean_batch, batches):
+                outfile.write(output_lines)
+                row_count += batch_count
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    print("    ...processed row {:,}...".format(row_count))
+                    last_report = time.monotonic()
+
+    print("{:,} rows complete.".format(row_count))
+    print("Cleaned output written to {}.".format(OUTPUT_FILENAME))
+
+
+def batched(iterable, size):
+    """Yield successive lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def init_worker(nicknames, row_length, input_index, passthrough_index):
+    """Store the per-run state that clean_batch needs in each worker process"""
+    global _nicknames, _row_length, _input_index, _passthrough_index
+    _nicknames = nicknames
+    _row_length = row_length
+    _input_index = input_index
+    _passthrough_index = passthrough_index
+
+
+def clean_batch(rows):
+    """Clean a batch of raw source rows into a count and the encoded output lines"""
+    output_rows = []
+    for row in rows:
+        # Like csv.DictReader, treat short rows as None-filled.
+        if len(row) < _row_length:
+            row += [None] * (_row_length - len(row))
+        output_row = build_row([row[j] for j in _input_index], _nicknames)
+        output_rows.append(
+            output_row + [quote_field(row[j]) for j in _passthrough_index]
+        )
+    # Formatted here in the worker, so the main process only has bytes to write out.
+    return len(output_rows), format_lines(output_rows)
+
+
+def quote_field(value):
+    """Quote a passthrough value for the output CSV, as csv.writer would"""
+    if value is None:
+        return MISSING_VALUE
+    if _NEEDS_QUOTING.search(value):
+        return '"' + value.replace('"', '""') + '"'
+    return value
 
-    output_table = process_all_rows(input_table, nicknames)
 
-    write_output(output_table, OUTPUT_FILENAME, OUTPUT_FIELDS)
+def format_lines(rows):
+    """Join rows of already-quoted fields into utf-8 encoded CSV lines"""
+    lines = [",".join(row) + _LINE_TERMINATOR for row in rows]
+    return "".join(lines).encode("utf-8")
 
 
 def load_nicknames(filename):
@@ -78,78 +191,82 @@ def load_nicknames(filename):
     print("Creating nickname lookup from {}.".format(filename))
     with open(filename, "r", encoding="utf-8-sig") as infile:
         reader = csv.DictReader(infile)
-        return {row["raw_name"]: row["name_group"] for row in reader}
-
-
-def load_input(filename):
-    """Create and validate the fields found in a source file"""
-    print("Reading source names from {}.".format(filename))
-    # utf-8-sig should provide a little more flexibility, e.g., SSMS outputs a BOM
-    with open(filename, "r", encoding="utf-8-sig") as infile:
-        reader = csv.DictReader(infile)
-        # If there is an excessively large quantity of records (multimillions)
-        # then we may want instead stream via generators to a tempfile.
-        return [row for row in reader]
+        # Interned, so the many raw names sharing a name group share one string.
+        return {
+            sys.intern(row["raw_name"]): sys.intern(row["name_group"]) for row in reader
+        }
 
 
-def process_all_rows(input_table, nicknames):
-    print("{:,} rows to process.".format(len(input_table)))
-    result = [process_row(i, row, nicknames) for i, row in enumerate(input_table)]
-    print("{:,} rows complete.".format(len(result)))
-    return result
+def build_row(row, nicknames):
+    """Clean one row of INPUT_FIELDS values into a list of OUTPUT_FIELDS values"""
+    name_first_middle, name_last, mob, yob = row
 
-
-def process_row(i, row, nicknames):
-    if (i + 1) % 100000 == 0:
-        print("    ...processing row {:,}...".format(i + 1))
-
-    # Create the building blocks for the output: normalized given, family, month, year.
-    normalized_row = normalize(row)
-
-    # Use the normalized fields to form first word, final word, initials, etc.
-    working_row = add_parsed_name_versions(normalized_row)
-
-    # Create the nickname, either from the table or falling back to the plain name.
-    very_first = working_row.get("given_first_word", MISSING_VALUE)
-    working_row["given_nickname"] = nicknames.get(very_first, very_first)
-
-    # Remove all spaces from all output fields (NOT from external IDs, etc.)
-    final_row = {}
-    for key, value in working_row.items():
-        if key in OUTPUT_FIELDS:
-            value = value.replace(" ", "")
-        final_row[key] = value
-    return final_row
-
-
-def normalize(row):
-    """Validate and clean each raw row into a new row."""
-    # Move as-is anything that is not one of the required INPUT_FIELDS
-    new_row = {k: v for k, v in row.items() if k not in INPUT_FIELDS}
-    # Create a cleaned version of each of the INPUT_FIELDS
-    new_row["given"] = clean_name(row["name_first_middle"])
-    new_row["family"] = clean_name(row["name_last"])
+    # The given name's words are split apart before its spaces are dropped.
+    words = clean_name(name_first_middle).split()
+    family = clean_name(name_last, True)
     # For months, minimum = 1 and maximum = 12
-    new_row["month"] = clean_integer(row["mob"], minimum=1, maximum=12)
+    month = clean_integer(mob, 1, 12)
     # In the data we're matching, birth years prior to 1902 all appear to be null
-    new_row["year"] = clean_integer(row["yob"], minimum=1902, maximum=2010)
-    return new_row
-
+    year = clean_integer(yob, 1902, 2010)
+
+    # Use the given name's words to form first word, final word, initials, etc.
+    # Most given names have one or two words, which need no slicing or joining.
+    word_count = len(words)
+    if word_count == 2:
+        first_word, final_word = words
+        given = first_word + final_word
+        all_but_first = final_word
+        all_but_final = first_word
+    elif word_count > 2:
+        first_word = words[0]
+        final_word = words[-1]
+        given = "".join(words)
+        all_but_first = "".join(words[1:])
+        all_but_final = "".join(words[:-1])
+    else:
+        # If there is only one word in the given name (or none), the rest are blanks
+        given = first_word = words[0] if words else MISSING_VALUE
+        final_word = all_but_first = all_but_final = MISSING_VALUE
+    # Initials for the 'middle given' and for the 'final middle'
+    middle_initial = all_but_first[:1]
+    final_initial = final_word[:1]
 
+    # Create the nickname, either from the table or falling back to the plain name.
+    nickname = nicknames.get(first_word, first_word)
+
+    return [
+        given,
+        family,
+        month,
+        year,
+        given + family,
+        nickname,
+        first_word,
+        middle_initial,
+        all_but_first,
+        all_but_final,
+        final_initial,
+        final_word,
+    ]
+
+
+# Names repeat heavily across rows (especially given names), so remember them.
+@functools.lru_cache(maxsize=200000)
 def clean_name(raw, remove_spaces=False):
     """Clean each input name down to lowercase ascii letters and spaces"""
     working = raw
-    # Strip unicode down to ascii (e.g. Ë becomes E; ñ becomes n)
-    working = unidecode.unidecode_expect_ascii(working)
-    # Make all lowercase
-    working = working.lower()
-    # Remove absolutely everything except the lowercase letters and spaces
-    acceptable = string.ascii_lowercase
-    if not remove_spaces:
-        acceptable = acceptable + " "
-    return "".join(c for c in working if c in acceptable)
-
-
+    # Strip unicode down to ascii (e.g. Ë becomes E; ñ becomes n); most names
+    # are already ascii, and those can skip the unidecode call entirely.
+    if not working.isascii():
+        working = unidecode.unidecode_expect_ascii(working)
+    # Make all lowercase and remove absolutely everything except the letters and
+    # spaces, both in a single pass over the bytes.
+    delete = _NOT_LETTERS if remove_spaces else _NOT_LETTERS_SPACE
+    return working.encode("ascii").translate(_LOWERCASE, delete).decode("ascii")
+
+
+# Month and year columns hold only a handful of distinct raw values, so remember them.
+@functools.lru_cache(maxsize=4096)
 def clean_integer(raw_input, minimum, maximum):
     """Filter (stringed) integer field to allow only the specified range"""
     try:
@@ -158,56 +275,12 @@ def clean_integer(raw_input, minimum, maximum):
     except (ValueError, TypeError):
         # Anything that cannot be converted to an integer returns null
         return MISSING_VALUE
-    if numbered not in range(minimum, maximum + 1):
+    if not minimum <= numbered <= maximum:
         # Anything outside the acceptable range returns null
         return MISSING_VALUE
     return str(numbered)
 
 
-def add_parsed_name_versions(r):
-    """Create the new parsed versions of the input fields"""
-    given = r["given"].split()
-
-    try:
-        r["given_first_word"] = given[0]
-    except IndexError:
-        # Indicates that given has no words; i.e., no given name at all.
-        r["complete"] = r["family"]
-        # With no given name, the function's job here is done.
-        return r
-
-    multiple_given = len(given) > 1
-    # If there is only one word in the given name, these will all be blanks
-    if multiple_given:
-        r["given_final_word"] = given[-1]
-        r["given_all_but_first"] = "".join(given[1:])
-        r["given_all_but_final"] = "".join(given[:-1])
-
-    # Initials for the 'middle given'
-    if r.get("given_all_but_first"):
-        r["given_middle_initial"] = r["given_all_but_first"][0]
-    # and for the 'final middle'
-    if r.get("given_final_word"):
-        r["given_final_initial"] = r["given_final_word"][0]
-
-    r["complete"] = "".join((r["given"], r["family"]))
-    return r
-
-
-def write_output(output_table, output_file, output_fields):
-    """Write out the CSV"""
-    # Derive the fieldnames from the first row.
-    fields = sorted(set(field for row in output_table for field in row))
-    assert set(output_fields) <= set(fields), "Not all output fields were created."
-
-    with open(output_file, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.DictWriter(outfile, restval=MISSING_VALUE, fieldnames=fields)
-        writer.writeheader()
-        for row in output_table:
-            writer.writerow(row)
-    print("Cleaned output written to {}.".format(output_file))
-
-
 if __name__ == "__main__":
     scriptfile = __file__
     starttime = time.time()
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def nicknames():
+    from NCSES_clean_names import load_nicknames, NICKNAME_FILENAME
+
+    return load_nicknames(NICKNAME_FILENAME)
+
+
+def pytest_generate_tests(metafunc):
+    # Only runs for collected tests, so the nickname file is not read just to build
+    # the parameters of the (normally skipped) per-name diagnostic test.
+    if "nickname_name" in metafunc.fixturenames:
+        from NCSES_clean_names import load_nicknames, NICKNAME_FILENAME
+
+        nicknames = load_nicknames(NICKNAME_FILENAME)
+        all_names = set(nicknames.keys()) ^ set(nicknames.values())
+        metafunc.parametrize("nickname_name", sorted(all_names))
@@ -1,3 +1,5 @@
+import csv
+import io
 import os
 import re
 import sys
@@ -6,26 +8,22 @@ from pathlib import Path
 
 sys.path.append(str(Path(".").resolve()))
 
-from NCSES_clean_names import load_nicknames, NICKNAME_FILENAME
 
-nicknames = load_nicknames(NICKNAME_FILENAME)
-all_names = set(nicknames.keys()) ^ set(nicknames.values())
-
-
-def test_nicknames_no_chained_key_values():
+def test_nicknames_no_chained_key_values(nicknames):
     intersect = set(nicknames.keys()) & set(nicknames.values())
     assert not intersect
 
 
-def test_nicknames_all_fully_normalized():
+def test_nicknames_all_fully_normalized(nicknames):
+    all_names = set(nicknames.keys()) ^ set(nicknames.values())
     assert all(re.match(r"^[a-z]+$", name) for name in all_names)
 
 
 # Long and slow -- for diagnosis on a problem. Remove SKIP_ from function name to run.
-@pytest.mark.parametrize("name", all_names)
-def SKIP_test_slowly_nicknames_all_fully_normalized(name):
+# (conftest.py parametrizes nickname_name over every name in the nickname file.)
+def SKIP_test_slowly_nicknames_all_fully_normalized(nickname_name):
     # Remove SKIP_ from function name to run.
-    assert re.match(r"^[a-z]+$", name)
+    assert re.match(r"^[a-z]+$", nickname_name)
 
 
 from NCSES_clean_names import clean_integer
@@ -74,3 +72,158 @@ def test_valid_clean_months(raw, clean):
 )
 def test_invalid_clean_months(raw):
     assert clean_integer(raw, 1, 12) == ""
+
+
+@pytest.mark.parametrize(
+    "raw, clean",
+    [
+        ("1901", ""),
+        ("1902", "1902"),
+        ("01986", "1986"),
+        ("2010", "2010"),
+        ("2011", ""),
+        ("-1986", ""),
+        ("1986.0", ""),
+    ],
+)
+def test_clean_years_range_bounds(raw, clean):
+    assert clean_integer(raw, 1902, 2010) == clean
+
+
+from NCSES_clean_names import clean_name
+
+
+@pytest.mark.parametrize(
+    "raw, clean, clean_no_spaces",
+    [
+        ("Kit", "kit", "kit"),
+        ("Fábia Marciano Ulla", "fabia marciano ulla", "fabiamarcianoulla"),
+        (" Berg", " berg", "berg"),
+        ("O'Brien-Smith", "obriensmith", "obriensmith"),
+        ("Zoë  Ann", "zoe  ann", "zoeann"),
+        ("ÆLFRED", "aelfred", "aelfred"),
+        ("J. R. R.", "j r r", "jrr"),
+        ("\tAnn\n", "ann", "ann"),
+        ("123", "", ""),
+        ("", "", ""),
+    ],
+)
+def test_clean_name(raw, clean, clean_no_spaces):
+    assert clean_name(raw) == clean
+    assert clean_name(raw, remove_spaces=True) == clean_no_spaces
+
+
+from NCSES_clean_names import OUTPUT_FIELDS, build_row
+
+
+# The cleaning examples from README.md, plus two-word and empty given names
+@pytest.mark.parametrize(
+    "row, expected",
+    [
+        (
+            ["Emilia Isobel Euphemia Rose", "Clarke", "10", "1986"],
+            {
+                "given": "emiliaisobeleuphemiarose",
+                "family": "clarke",
+                "month": "10",
+                "year": "1986",
+                "complete": "emiliaisobeleuphemiaroseclarke",
+                "given_nickname": "emilia",
+                "given_first_word": "emilia",
+                "given_middle_initial": "i",
+                "given_all_but_first": "isobeleuphemiarose",
+                "given_all_but_final": "emiliaisobeleuphemia",
+                "given_final_initial": "r",
+                "given_final_word": "rose",
+            },
+        ),
+        (
+            ["Kit", "Harington", "??", "1986"],
+            {
+                "given": "kit",
+                "family": "harington",
+                "month": "",
+                "year": "1986",
+                "complete": "kitharington",
+                "given_nickname": "christopher",
+                "given_first_word": "kit",
+                "given_middle_initial": "",
+                "given_all_but_first": "",
+                "given_all_but_final": "",
+                "given_final_initial": "",
+                "given_final_word": "",
+            },
+        ),
+        (
+            ["Jean-Paul  Ann", "Sartre", "6", "1905"],
+            {
+                "given": "jeanpaulann",
+                "family": "sartre",
+                "month": "6",
+                "year": "1905",
+                "complete": "jeanpaulannsartre",
+                "given_nickname": "jeanpaul",
+                "given_first_word": "jeanpaul",
+                "given_middle_initial": "a",
+                "given_all_but_first": "ann",
+                "given_all_but_final": "jeanpaul",
+                "given_final_initial": "a",
+                "given_final_word": "ann",
+            },
+        ),
+        (
+            [" ", "van der Berg", None, "1901"],
+            dict(
+                dict.fromkeys(OUTPUT_FIELDS, ""),
+                family="vanderberg",
+                complete="vanderberg",
+            ),
+        ),
+    ],
+)
+def test_build_row(row, expected, nicknames):
+    assert dict(zip(OUTPUT_FIELDS, build_row(row, nicknames))) == expected
+
+
+from NCSES_clean_names import (
+    batched,
+    clean_batch,
+    format_lines,
+    init_worker,
+    quote_field,
+)
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_clean_batch_passthrough_and_short_rows(nicknames):
+    # Source columns: id, name_last, name_first_middle, mob, yob, note
+    init_worker(nicknames, 6, [2, 1, 3, 4], [0, 5])
+    batch = [
+        ["7", "Harington", "Kit", "12", "1986", 'say "hi", twice\n'],
+        ["8", "Clarke", "Emilia", "5"],
+    ]
+    row_count, output_lines = clean_batch(batch)
+    output_rows = list(
+        csv.reader(io.StringIO(output_lines.decode("utf-8"), newline=""))
+    )
+    assert row_count == 2
+    assert [row[:6] + row[-2:] for row in output_rows] == [
+        ["kit", "harington", "12", "1986", "kitharington", "christopher", "7"]
+        + ['say "hi", twice\n'],
+        ["emilia", "clarke", "5", "", "emiliaclarke", "emilia", "8", ""],
+    ]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [["a", "b c", "", "d,e", 'f"g', "h\ri", "j\nk", "ünï"], ["", "x"], ['""']],
+)
+def test_format_lines_matches_csv_writer(values):
+    expected = io.StringIO()
+    csv.writer(expected).writerow(values)
+    quoted = [quote_field(value) for value in values]
+    assert format_lines([quoted]) == expected.getvalue().encode("utf-8")